@@ -1,12 +1,24 @@
 # backend/app/agent_cli.py
 from pathlib import Path
+import asyncio
+import hashlib
+import os
+import subprocess
 import sys
-from typing import Any
+from typing import Any, Optional
 
 from dotenv import load_dotenv
 
+load_dotenv()  # load .env if present; before app.graph, which builds the LLM client at import
+
+import aiosqlite
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from app import models
 from app.models import AgentState, RepoContext
-from app.graph import build_graph
+from app.graph import build_graph, _cache_dir
+from app.runner import _tf_fingerprint
 
 
 def _to_agent_state(x: Any) -> AgentState:
@@ -21,10 +33,91 @@ def _to_agent_state(x: Any) -> AgentState:
     raise TypeError(f"Unexpected graph output type: {type(x)}")
 
 
+def _changed_modules(repo_dir: str) -> Optional[int]:
+    """
+    Count distinct directories with changed *.tf files since the merge base with
+    INFRAGUARDIAN_BASE_REF (default origin/main), uncommitted and untracked files included.
+    Upstream-only commits on the base are not counted. Returns None when git is
+    unavailable, this is not a repo, or the base ref is unknown.
+    """
+    base = os.getenv("INFRAGUARDIAN_BASE_REF", "origin/main")
+    try:
+        merge_base = subprocess.run(
+            ["git", "merge-base", base, "HEAD"],
+            cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, check=True,
+        ).stdout.strip()
+        proc = subprocess.run(
+            ["git", "diff", "--name-only", merge_base, "--", "."],
+            cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, check=True,
+        )
+        untracked = subprocess.run(
+            ["git", "ls-files", "--others", "--exclude-standard", "--full-name", "--", "."],
+            cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, check=True,
+        )
+    except Exception:
+        return None
+    # both lists are relative to the git root (diff always is; ls-files via --full-name)
+    paths = proc.stdout.splitlines() + untracked.stdout.splitlines()
+    dirs = {str(Path(p).parent) for p in paths if p.endswith(".tf")}
+    return len(dirs)
+
+
+def _thread_id(ctx: RepoContext) -> str:
+    """
+    Checkpoint thread per (repo, git HEAD, diff summary, *.tf fingerprint), so an
+    interrupted run is only resumed for the same inputs, uncommitted edits included.
+    """
+    try:
+        head = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ctx.repo_dir, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        head = ""
+    repo = Path(ctx.repo_dir).resolve()
+    parts = [str(repo), head, ctx.diff_summary or "", _tf_fingerprint(repo)]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+# Our state models, explicitly allowed for checkpoint deserialization.
+_CHECKPOINT_TYPES = (
+    models.AgentState, models.RepoContext, models.PlanStep, models.ReviewPlan,
+    models.Findings, models.Synthesis, models.PatchSuggestion,
+)
+
+
+def _checkpoint_serde() -> JsonPlusSerializer:
+    try:
+        return JsonPlusSerializer(allowed_msgpack_modules=_CHECKPOINT_TYPES)
+    except TypeError:  # older langgraph-checkpoint: no allowlist, types load as before
+        return JsonPlusSerializer()
+
+
+async def _run_graph(state: AgentState) -> Any:
+    # Checkpoints live in the cache dir, not in the repo under review
+    db = _cache_dir() / "checkpoint.db"
+    db.parent.mkdir(parents=True, exist_ok=True)
+    config = {"configurable": {"thread_id": _thread_id(state.ctx)}}
+    async with aiosqlite.connect(str(db)) as conn:
+        saver = AsyncSqliteSaver(conn, serde=_checkpoint_serde())
+        graph = build_graph(checkpointer=saver)
+        # A previous run on this thread stopped mid-graph: resume it instead of starting over,
+        # unless its context differs from this invocation's
+        snapshot = await graph.aget_state(config)
+        prev = (snapshot.values or {}).get("ctx")
+        if isinstance(prev, RepoContext):
+            prev = prev.model_dump()
+        if snapshot.next and prev == state.ctx.model_dump():
+            print(f"Resuming interrupted run at: {', '.join(snapshot.next)}")
+            return await graph.ainvoke(None, config)
+        return await graph.ainvoke(state, config)
+
+
 # Usage: python -m app.agent_cli <repo_dir> [diff_summary]
 def main():
-    load_dotenv()  # load .env if present
-
     if len(sys.argv) < 2:
         print("Usage: python -m app.agent_cli <repo_dir> [diff_summary]")
         sys.exit(1)
@@ -33,9 +126,13 @@ def main():
     diff_summary = sys.argv[2] if len(sys.argv) > 2 else None
 
     # Build initial state and run the agent graph
-    state = AgentState(ctx=RepoContext(repo_dir=repo_dir, diff_summary=diff_summary))
-    graph = build_graph()
-    out = graph.invoke(state)
+    ctx = RepoContext(
+        repo_dir=repo_dir,
+        diff_summary=diff_summary,
+        changed_modules=_changed_modules(repo_dir),
+    )
+    state = AgentState(ctx=ctx)
+    out = asyncio.run(_run_graph(state))  # tools node is async
 
     # Normalize to AgentState (handles dict outputs)
     out_state = _to_agent_state(out)
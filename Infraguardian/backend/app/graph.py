@@ -1,24 +1,40 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import hashlib
 import os
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional, Type
 
+import orjson
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
 
 from app.models import (
-    AgentState, ReviewPlan, PlanStep, Findings, Synthesis, PatchSuggestion,
+    AgentState, RepoContext, ReviewPlan, PlanStep, Findings, Synthesis, PatchSuggestion,
 )
+from app.semantic_cache import get_semantic_cache
 from app.runner import (
-    terraform_plan, tfsec_scan, checkov_scan, infracost_breakdown, aggregate,
+    terraform_init, terraform_plan, tfsec_scan, checkov_scan, infracost_breakdown, aggregate,
 )
 
 def _env(name: str, default: Optional[str] = None) -> Optional[str]:
     val = os.getenv(name)
     return val if val not in (None, "") else default
 
+def _env_num(name: str, default, cast=int):
+    """Numeric env setting; a malformed value falls back to `default` instead of raising."""
+    try:
+        return cast(_env(name, str(default)))
+    except ValueError:
+        return default
+
+@functools.lru_cache(maxsize=1)
 def _llm() -> Optional[ChatOpenAI]:
+    # One client per process (env captured on first call) so the httpx pool is reused.
     api_key = _env("OPENAI_API_KEY")
     if not api_key:
         return None
@@ -28,90 +44,211 @@ def _llm() -> Optional[ChatOpenAI]:
     except Exception:
         return None
 
+@functools.lru_cache(maxsize=None)
+def _structured_llm(schema: Type[BaseModel]):
+    """Structured-output wrapper around _llm(), built once per schema."""
+    llm = _llm()
+    return llm.with_structured_output(schema) if llm else None
+
+# Client + ReviewPlan schema wrapper are built at import, so planner calls only
+# invoke. The env (.env included, see agent_cli) must be loaded before import.
+_PLAN_CHAIN = _structured_llm(ReviewPlan)
+
+def _cache_dir() -> Path:
+    return Path(_env("INFRAGUARDIAN_CACHE_DIR", str(Path.home() / ".cache" / "infraguardian")))
+
+def _llm_cache_path(llm: ChatOpenAI, messages: list[dict], schema: Optional[Type[BaseModel]] = None) -> Path:
+    model = getattr(llm, "model_name", None) or _env("OPENAI_MODEL", "gpt-4o-mini")
+    schema_name = schema.__name__ if schema else None
+    key = hashlib.sha256(
+        orjson.dumps({"model": model, "messages": messages, "schema": schema_name}, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    return _cache_dir() / f"{key}.json"
+
+def _llm_cache_get(path: Path, schema: Optional[Type[BaseModel]] = None) -> Any:
+    """Cached response at `path` if present and younger than INFRAGUARDIAN_CACHE_TTL, else None."""
+    ttl = _env_num("INFRAGUARDIAN_CACHE_TTL", 7 * 24 * 3600, float)
+    try:
+        if path.exists() and time.time() - path.stat().st_mtime < ttl:
+            raw = path.read_bytes()
+            return schema.model_validate_json(raw) if schema else orjson.loads(raw)["content"]
+    except Exception:
+        pass  # corrupt/unreadable entry -> treat as miss
+    return None
+
+def _cached_llm_invoke(llm: ChatOpenAI, messages: list[dict], schema: Optional[Type[BaseModel]] = None) -> Any:
+    """
+    Exact-match disk cache around an LLM call, keyed by SHA256 of model + messages + schema.
+    Returns a `schema` instance for structured output, otherwise the message content string.
+    Entries older than INFRAGUARDIAN_CACHE_TTL seconds (default 7 days) are ignored.
+    """
+    path = _llm_cache_path(llm, messages, schema)
+    cached = _llm_cache_get(path, schema)
+    if cached is not None:
+        return cached
+
+    if schema:
+        out = _structured_llm(schema).invoke(messages)
+        payload = out.model_dump_json().encode()
+    else:
+        out = llm.invoke(messages).content
+        payload = orjson.dumps({"content": out})
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(payload)
+    except OSError:
+        pass
+    return out
+
 def _shorten(text: Optional[str], max_chars: int = 4000) -> Optional[str]:
     if not text:
         return text
     return text if len(text) <= max_chars else text[:max_chars] + f"\n...[truncated {len(text) - max_chars} chars]"
 
+# Static system prompts, always sent first and never interpolated; everything
+# run-specific goes into the (sorted-key) user message.
+_PLANNER_PREFIX = (
+    "You are an Infrastructure-as-Code review planner. "
+    "Given a repo diff summary and policy snippets, decide the MINIMAL set of tools to run "
+    "(allowed tools: terraform_plan, tfsec, checkov, conftest, infracost, gitleaks) and any flags. "
+    "Output strictly a ReviewPlan JSON matching the schema."
+)
+
+_SYNTH_PREFIX = (
+    "You are an expert IaC security and FinOps reviewer. "
+    "Given structured findings from tools, write ONE concise Markdown report suitable for a PR comment. "
+    "Include: severity rollups, a few top issues with resource IDs, CIS/NIST refs when clear, "
+    "estimated monthly cost (if available), and SPECIFIC actionable fixes. "
+    "Keep under ~300 lines and do not invent data."
+)
+
+def _stable_json(payload: Any) -> str:
+    # Deterministic key order/spacing keeps identical inputs byte-identical.
+    return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS, default=str).decode()
+
+def _default_plan(ctx: RepoContext, justification: str) -> ReviewPlan:
+    """
+    Deterministic plan. Small diffs (fewer than INFRAGUARDIAN_FAST_PATH_MODULES changed
+    modules, default 3) skip Checkov: its rule set largely overlaps tfsec for Terraform,
+    while its Python cold start adds ~10s. Unknown diff size keeps the full plan.
+    """
+    threshold = _env_num("INFRAGUARDIAN_FAST_PATH_MODULES", 3)
+    fast = bool(ctx.changed_modules) and ctx.changed_modules < threshold
+    steps = [PlanStep(tool="terraform_plan"), PlanStep(tool="tfsec")]
+    if fast:
+        justification += f" Small diff ({ctx.changed_modules} module(s)): tfsec-only fast path."
+    else:
+        steps.append(PlanStep(tool="checkov"))
+    steps.append(PlanStep(tool="infracost"))
+    return ReviewPlan(steps=steps, justification=justification)
+
 def planner_node(state: AgentState) -> AgentState:
-    llm = _llm()
     ctx = state.ctx
-    if not llm:
-        state.plan = ReviewPlan(
-            steps=[
-                PlanStep(tool="terraform_plan"),
-                PlanStep(tool="tfsec"),
-                PlanStep(tool="checkov"),
-                PlanStep(tool="infracost"),
-            ],
-            justification="Deterministic fallback (no LLM/model unavailable).",
-        )
+    if _PLAN_CHAIN is None:
+        state.plan = _default_plan(ctx, "Deterministic fallback (no LLM/model unavailable).")
         return state
 
-    system_prompt = (
-        "You are an Infrastructure-as-Code review planner. "
-        "Given a repo diff summary and policy snippets, decide the MINIMAL set of tools to run "
-        "(allowed tools: terraform_plan, tfsec, checkov, conftest, infracost, gitleaks) and any flags. "
-        "Output strictly a ReviewPlan JSON matching the schema."
-    )
     user_payload = {
         "diff_summary": _shorten(ctx.diff_summary, 2000),
         "policy_snippets": (ctx.policy_snippets or [])[:6],
-        "tools": ["terraform_plan","tfsec","checkov","conftest","infracost","gitleaks"],
+        "changed_modules": ctx.changed_modules,
     }
 
     try:
-        plan: ReviewPlan = llm.with_structured_output(ReviewPlan).invoke(
+        plan: ReviewPlan = _cached_llm_invoke(
+            _llm(),
             [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": str(user_payload)},
-            ]
+                {"role": "system", "content": _PLANNER_PREFIX},
+                {"role": "user", "content": _stable_json(user_payload)},
+            ],
+            schema=ReviewPlan,
         )
         if not plan.steps:
             raise ValueError("LLM returned an empty plan.")
         state.plan = plan
     except Exception as e:
-        state.plan = ReviewPlan(
-            steps=[
-                PlanStep(tool="terraform_plan"),
-                PlanStep(tool="tfsec"),
-                PlanStep(tool="checkov"),
-                PlanStep(tool="infracost"),
-            ],
-            justification=f"LLM planning failed: {e}. Using default plan.",
-        )
+        state.plan = _default_plan(ctx, f"LLM planning failed: {e}. Using default plan.")
     return state
 
-def tools_node(state: AgentState) -> AgentState:
+async def tools_node(state: AgentState) -> AgentState:
     repo_dir = Path(state.ctx.repo_dir).resolve()
     results = {}
     steps = state.plan.steps if state.plan else []
 
-    ordered = sorted(steps, key=lambda s: 0 if s.tool == "terraform_plan" else 1)
+    tools = {s.tool for s in steps}
 
-    for step in ordered:
-        t = step.tool
-        if t == "terraform_plan":
-            results["terraform"] = terraform_plan(repo_dir)
-        elif t == "tfsec":
-            results["tfsec"] = tfsec_scan(repo_dir)
-        elif t == "checkov":
-            results["checkov"] = checkov_scan(repo_dir)
-        elif t == "infracost":
-            results["infracost"] = infracost_breakdown(repo_dir)
-        # conftest/gitleaks hooks later
+    async def guarded(key: str, fn) -> None:
+        try:
+            results[key] = await fn(repo_dir)
+        except Exception as e:
+            results[key] = {"ok": False, "stderr": f"{key} failed: {e}"}
+
+    # init runs alone first: it writes .terraform/modules, which tfsec reads to
+    # resolve remote modules. Nothing else consumes the plan JSON, so the scanners
+    # overlap with plan/show and aggregate joins them at the end.
+    jobs = []
+    if "terraform_plan" in tools:
+        await guarded("terraform", terraform_init)
+        if results["terraform"] is None:  # init ok (or skipped); plan/show next
+            jobs.append(guarded("terraform", functools.partial(terraform_plan, skip_init=True)))
+    for t, fn in (("tfsec", tfsec_scan), ("checkov", checkov_scan), ("infracost", infracost_breakdown)):
+        if t in tools:
+            jobs.append(guarded(t, fn))
+    # conftest/gitleaks hooks later
+    await asyncio.gather(*jobs)
 
     agg = aggregate(results)
     state.findings = Findings(
-        tfsec=agg.get("tfsec", {}),
-        checkov=agg.get("checkov", {}),
+        tfsec={**agg.get("tfsec", {}), "top": agg.get("top_tfsec", []),
+               "parsed": results.get("tfsec", {}).get("json") is not None},
+        checkov={**agg.get("checkov", {}), "top": agg.get("top_checkov", []),
+                 "parsed": results.get("checkov", {}).get("json") is not None},
         terraform=results.get("terraform", {}),
         infracost=agg.get("infracost", {}),
         warnings=agg.get("warnings", []),
     )
     return state
 
+_CLEAN_REPORT_TEMPLATE = """# InfraGuardian Report
+
+✅ **No issues found.** {scanners} reported no failed checks for this change.
+
+**Estimated Monthly Cost**: {cost}
+"""
+
+_SCANNER_LABELS = {"tfsec": "tfsec", "checkov": "Checkov"}
+
+def _clean_scanners(state: AgentState) -> Optional[list[str]]:
+    """
+    Labels of the scanners that ran, parsed and found nothing, when the whole run is
+    clean: every planned scanner produced JSON with zero findings, terraform_plan (if
+    planned) succeeded and there are no warnings. Otherwise None.
+    """
+    findings = state.findings
+    planned = {s.tool for s in state.plan.steps} if state.plan else set()
+    ran = [t for t in _SCANNER_LABELS if t in planned]
+    if not ran or findings.warnings:
+        return None
+    if "terraform_plan" in planned and not findings.terraform.get("ok"):
+        return None
+    for t in ran:
+        f = getattr(findings, t)
+        if not f.get("parsed") or f.get("count", 0) != 0:
+            return None
+    return [_SCANNER_LABELS[t] for t in ran]
+
 def synth_node(state: AgentState) -> AgentState:
+    findings = state.findings
+    # Clean run: nothing for the LLM to summarize, so skip the round-trip.
+    clean = _clean_scanners(state)
+    if clean:
+        cost = findings.infracost.get("monthly_cost")
+        state.synthesis = Synthesis(markdown=_CLEAN_REPORT_TEMPLATE.format(
+            scanners=" and ".join(clean),
+            cost=f"${cost:,.2f}" if cost is not None else "unavailable"))
+        return state
+
     llm = _llm()
     if not llm:
         tfsec = state.findings.tfsec
@@ -129,20 +266,45 @@ def synth_node(state: AgentState) -> AgentState:
         state.synthesis = Synthesis(markdown="\n\n".join(md))
         return state
 
-    system_prompt = (
-        "You are an expert IaC security and FinOps reviewer. "
-        "Given structured findings from tools, write ONE concise Markdown report suitable for a PR comment. "
-        "Include: severity rollups, a few top issues with resource IDs, CIS/NIST refs when clear, "
-        "estimated monthly cost (if available), and SPECIFIC actionable fixes. "
-        "Keep under ~300 lines and do not invent data."
+    messages = [
+        {"role": "system", "content": _SYNTH_PREFIX},
+        {"role": "user", "content": _stable_json(state.findings.model_dump())},
+    ]
+    # Opt-in semantic cache, consulted only after an exact-match miss. Candidates must
+    # share severity rollups, cost bucket, warnings, tool status, model and prompt
+    # exactly; only the top-issue text is compared by embedding, so runs without
+    # any top issues never use it.
+    tfsec, checkov = state.findings.tfsec, state.findings.checkov
+    total = state.findings.infracost.get("monthly_cost")
+    sem_partition = hashlib.sha256(_stable_json({
+        "tfsec": tfsec.get("severities", {}),
+        "checkov": checkov.get("severities", {}),
+        "cost_bucket": round(total or 0, -1),
+        "warnings": sorted(state.findings.warnings),
+        "terraform_ok": state.findings.terraform.get("ok"),
+        "parsed": [tfsec.get("parsed"), checkov.get("parsed")],
+        "model": getattr(llm, "model_name", None),
+        "prompt": hashlib.sha256(_SYNTH_PREFIX.encode()).hexdigest(),
+    }).encode()).hexdigest()
+    sem_text = "\n".join(
+        f"{f.get('rule') or f.get('check_id')} {f.get('severity')} {f.get('resource')}"
+        for f in tfsec.get("top", []) + checkov.get("top", [])
     )
     try:
-        md = llm.invoke(
-            [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": str(state.findings.model_dump())},
-            ]
-        ).content
+        md = _llm_cache_get(_llm_cache_path(llm, messages))
+        sem_cache = get_semantic_cache(_cache_dir()) if md is None and sem_text else None
+        if sem_cache:
+            try:
+                md = sem_cache.lookup(sem_partition, sem_text)
+            except Exception:
+                md = None  # cache trouble must never cost us the report
+        if md is None:
+            md = _cached_llm_invoke(llm, messages)
+            if sem_cache and md:
+                try:
+                    sem_cache.add(sem_partition, sem_text, md)
+                except Exception:
+                    pass
         state.synthesis = Synthesis(markdown=md or "(empty)")
     except Exception as e:
         state.synthesis = Synthesis(
@@ -162,7 +324,12 @@ def patcher_node(state: AgentState) -> AgentState:
     )
     return state
 
-def build_graph():
+def build_graph(checkpointer=None):
+    """
+    Compile the review graph. With a `checkpointer` (e.g. AsyncSqliteSaver) state is
+    persisted at node boundaries, so an interrupted run resumes from the last
+    completed node for the same thread_id.
+    """
     g = StateGraph(AgentState)
     g.add_node("planner", planner_node)
     g.add_node("tools", tools_node)
@@ -174,4 +341,4 @@ def build_graph():
     g.add_edge("tools", "synth")
     g.add_edge("synth", "patch")
     g.add_edge("patch", END)
-    return g.compile()
\ No newline at end of file
+    return g.compile(checkpointer=checkpointer)
\ No newline at end of file
@@ -1,35 +1,36 @@
 from __future__ import annotations
 from typing import List, Literal, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 ToolName = Literal["terraform_plan","tfsec","checkov","conftest","infracost","gitleaks"]
 
 class RepoContext(BaseModel):
     repo_dir: str
     diff_summary: Optional[str] = None
+    changed_modules: Optional[int] = None  # distinct dirs with changed *.tf files; None = unknown
     policy_snippets: Optional[List[str]] = None
 
 class PlanStep(BaseModel):
     tool: ToolName
-    args: Dict[str, Any] = {}
+    args: Dict[str, Any] = Field(default_factory=dict)
 
 class ReviewPlan(BaseModel):
     steps: List[PlanStep]
     justification: str
 
 class Findings(BaseModel):
-    tfsec: Dict[str, Any] = {}
-    checkov: Dict[str, Any] = {}
-    terraform: Dict[str, Any] = {}
-    conftest: Dict[str, Any] = {}
-    infracost: Dict[str, Any] = {}
-    gitleaks: Dict[str, Any] = {}
-    warnings: List[str] = []
+    tfsec: Dict[str, Any] = Field(default_factory=dict)
+    checkov: Dict[str, Any] = Field(default_factory=dict)
+    terraform: Dict[str, Any] = Field(default_factory=dict)
+    conftest: Dict[str, Any] = Field(default_factory=dict)
+    infracost: Dict[str, Any] = Field(default_factory=dict)
+    gitleaks: Dict[str, Any] = Field(default_factory=dict)
+    warnings: List[str] = Field(default_factory=list)
 
 class Synthesis(BaseModel):
     markdown: str
-    risks_ranked: List[Dict[str, Any]] = []
-    controls: List[str] = []
+    risks_ranked: List[Dict[str, Any]] = Field(default_factory=list)
+    controls: List[str] = Field(default_factory=list)
 
 class PatchSuggestion(BaseModel):
     patch_unified_diff: Optional[str] = None
@@ -38,6 +39,6 @@ class PatchSuggestion(BaseModel):
 class AgentState(BaseModel):
     ctx: RepoContext
     plan: Optional[ReviewPlan] = None
-    findings: Findings = Findings()
+    findings: Findings = Field(default_factory=Findings)
     synthesis: Optional[Synthesis] = None
     patch: Optional[PatchSuggestion] = None
\ No newline at end of file
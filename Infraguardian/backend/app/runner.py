@@ -1,52 +1,274 @@
 from __future__ import annotations
 from pathlib import Path
-import json, os, shutil, subprocess
-from typing import Dict, Any
+import asyncio, contextlib, hashlib, os, shutil, weakref
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, init is not serialized
+    fcntl = None
+
+import ijson
 
 CmdResult = Dict[str, Any]
 
-def _which(name: str) -> bool:
-    return shutil.which(name) is not None
+_SEVERITIES = ("CRITICAL", "HIGH", "MEDIUM", "LOW", "UNKNOWN")
 
-def _run(cmd: list[str], cwd: Path, env: dict | None = None) -> CmdResult:
+# Resolved once at import; commands are exec'd by absolute path.
+_TOOLS: Dict[str, Optional[str]] = {
+    name: shutil.which(name) for name in ("terraform", "tfsec", "checkov", "infracost")
+}
+
+# Caps concurrent scanner processes across all graph runs in this process, so a
+# server handling many PRs doesn't fork dozens of checkov interpreters at once.
+def _max_scans() -> int:
+    default = max(2, (os.cpu_count() or 2) // 2)
     try:
-        proc = subprocess.run(
-            cmd, cwd=str(cwd), env=env or os.environ.copy(),
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True, check=False
-        )
-        return {"ok": proc.returncode == 0, "code": proc.returncode,
-                "stdout": proc.stdout, "stderr": proc.stderr, "cmd": cmd}
+        return max(1, int(os.getenv("INFRAGUARDIAN_MAX_SCANS") or default))
+    except ValueError:
+        return default
+
+_MAX_SCANS = _max_scans()
+_SCAN_SEMS = weakref.WeakKeyDictionary()
+
+def _scan_sem() -> asyncio.Semaphore:
+    # asyncio primitives are bound to one loop; keep one semaphore per running loop
+    loop = asyncio.get_running_loop()
+    sem = _SCAN_SEMS.get(loop)
+    if sem is None:
+        sem = _SCAN_SEMS[loop] = asyncio.Semaphore(_MAX_SCANS)
+    return sem
+
+def _default_env() -> dict:
+    """
+    os.environ plus a shared TF_PLUGIN_CACHE_DIR so providers are downloaded once across
+    repos. Inits against it are serialized by _plugin_cache_lock.
+    """
+    env = os.environ.copy()
+    if not env.get("TF_PLUGIN_CACHE_DIR"):
+        cache = Path.home() / ".cache" / "infraguardian" / "tf-plugins"
+        try:
+            cache.mkdir(parents=True, exist_ok=True)
+            env["TF_PLUGIN_CACHE_DIR"] = str(cache)
+        except OSError:
+            pass
+    return env
+
+async def _run(cmd: list[str], cwd: Path, env: dict | None = None,
+               stdout_path: Optional[Path] = None) -> CmdResult:
+    """
+    Run `cmd` and capture its output. With `stdout_path`, stdout goes straight to
+    that file (returned as "stdout_path") instead of being buffered in memory.
+    """
+    try:
+        out_file = None
+        if stdout_path is not None:
+            stdout_path.parent.mkdir(parents=True, exist_ok=True)
+            out_file = open(stdout_path, "wb")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, cwd=str(cwd), env=env or _default_env(),
+                stdout=out_file or asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+            out, err = await proc.communicate()
+        finally:
+            if out_file is not None:
+                out_file.close()
+        res = {"ok": proc.returncode == 0, "code": proc.returncode,
+               "stderr": err.decode(errors="replace"), "cmd": cmd}
+        if stdout_path is not None:
+            res["stdout_path"] = str(stdout_path)
+        else:
+            res["stdout"] = out.decode(errors="replace")
+        return res
     except Exception as e:
         return {"ok": False, "code": -1, "stdout": "", "stderr": str(e), "cmd": cmd}
 
-def terraform_plan(repo: Path) -> CmdResult:
-    if not _which("terraform"):
+async def _run_stream(cmd: list[str], cwd: Path, parse: Callable[[Any], Awaitable[Any]],
+                      env: dict | None = None) -> CmdResult:
+    """
+    Like _run, but hands the stdout pipe to `parse` instead of buffering it.
+    The parsed value is returned under "json" (None if stdout was not valid JSON).
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=str(cwd), env=env or _default_env(),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        err_task = asyncio.ensure_future(proc.stderr.read())
+        try:
+            parsed = await parse(proc.stdout)
+        except Exception:
+            parsed = None
+        while await proc.stdout.read(1 << 16):  # drain whatever the parser left
+            pass
+        err = await err_task
+        await proc.wait()
+        return {"ok": proc.returncode == 0, "code": proc.returncode, "json": parsed,
+                "stderr": err.decode(errors="replace"), "cmd": cmd}
+    except Exception as e:
+        return {"ok": False, "code": -1, "json": None, "stderr": str(e), "cmd": cmd}
+
+async def _stream_items(stream, prefixes: Iterable[str], fields: Iterable[str]) -> List[Dict[str, Any]]:
+    """Collect objects found at any of `prefixes`, keeping only `fields` of each."""
+    prefixes, fields = set(prefixes), tuple(fields)
+    items: List[Dict[str, Any]] = []
+    builder = None
+    async for prefix, event, value in ijson.parse_async(stream):
+        if builder is None:
+            if prefix in prefixes and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            continue
+        builder.event(event, value)
+        if prefix in prefixes and event == "end_map":
+            items.append({k: builder.value.get(k) for k in fields})
+            builder = None
+    return items
+
+async def _parse_tfsec(stream) -> Dict[str, Any]:
+    return {"results": await _stream_items(
+        stream, ["results.item"], ("rule_id", "severity", "resource", "description"))}
+
+async def _parse_checkov(stream) -> Dict[str, Any]:
+    # checkov emits a dict for one framework and a list of dicts for several
+    failed = await _stream_items(
+        stream, ["results.failed_checks.item", "item.results.failed_checks.item"],
+        ("check_id", "check_name", "severity", "severity_label", "resource", "file_path"))
+    return {"results": {"failed_checks": failed}}
+
+async def _parse_infracost(stream) -> Dict[str, Any]:
+    costs = []
+    async for prefix, event, value in ijson.parse_async(stream):
+        if prefix == "projects.item.summary.totalMonthlyCost" and event != "null":
+            costs.append(value)
+    return {"projects": [{"summary": {"totalMonthlyCost": c}} for c in costs]}
+
+async def _parse_tf_plan(stream) -> Dict[str, Any]:
+    changes = await _stream_items(stream, ["resource_changes.item"], ("address", "type", "change"))
+    return {"resource_changes": [
+        {"address": c["address"], "type": c["type"], "actions": (c["change"] or {}).get("actions")}
+        for c in changes
+    ]}
+
+def _debug_info(res: CmdResult) -> CmdResult:
+    """
+    Small, state-safe view of a command result. Results end up in graph state,
+    which LangGraph copies/serializes on every edge, so stdout never travels.
+    """
+    return {"ok": res.get("ok", False), "code": res.get("code"),
+            "stderr": (res.get("stderr") or "")[:2000]}
+
+def _tf_fingerprint(repo: Path) -> str:
+    """Hash of (path, mtime, size) for the repo's *.tf files and provider lock file."""
+    files = [p for p in repo.rglob("*.tf") if ".terraform" not in p.relative_to(repo).parts]
+    lock = repo / ".terraform.lock.hcl"
+    if lock.exists():
+        files.append(lock)
+    h = hashlib.sha256()
+    for p in sorted(files):
+        st = p.stat()
+        h.update(f"{p.relative_to(repo)}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+    return h.hexdigest()
+
+@contextlib.asynccontextmanager
+async def _plugin_cache_lock(env: dict):
+    """
+    Exclusive lock on the shared TF_PLUGIN_CACHE_DIR. Terraform does not support
+    concurrent `init` against one plugin cache, so inits are serialized across
+    processes (flock) and across runs within this one.
+    """
+    cache = env.get("TF_PLUGIN_CACHE_DIR")
+    if fcntl is None or not cache:
+        yield
+        return
+    with open(Path(cache) / ".ig-init.lock", "a") as fh:
+        await asyncio.to_thread(fcntl.flock, fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+async def terraform_init(repo: Path) -> Optional[CmdResult]:
+    """
+    `terraform init -backend=false`, skipped when the *.tf/lock fingerprint matches
+    the last successful init. Returns None on success, else a failure result.
+    """
+    tf = _TOOLS.get("terraform")
+    if not tf:
         return {"ok": False, "stderr": "terraform not found"}
-    init = _run(["terraform", "init", "-backend=false"], cwd=repo)
-    if not init.get("ok"): return init
-    plan = _run(["terraform", "plan", "-no-color", "-out", "tf.plan"], cwd=repo)
-    if not plan.get("ok"): return plan
-    show = _run(["terraform", "show", "-json", "tf.plan"], cwd=repo)
-    return {"ok": show.get("ok", False), "json": _safe_json(show.get("stdout", "")), "raw": show}
-
-def tfsec_scan(repo: Path) -> CmdResult:
-    if not _which("tfsec"):
+    logs = repo / ".terraform"
+    fp_file = logs / ".ig_init_fp"
+    fp = _tf_fingerprint(repo)
+    if fp_file.exists() and fp_file.read_text() == fp:
+        return None
+    env = _default_env()
+    async with _plugin_cache_lock(env):
+        # init chatter can be large on big repos; keep it on disk for debugging only
+        init = await _run([tf, "init", "-backend=false"], cwd=repo, env=env,
+                          stdout_path=logs / "ig-init.log")
+    if not init.get("ok"): return _debug_info(init)
+    # init may create/update the lock file, so fingerprint again
+    fp_file.write_text(_tf_fingerprint(repo))
+    return None
+
+async def terraform_plan(repo: Path, skip_init: bool = False) -> CmdResult:
+    """plan + show -json. Pass skip_init=True when terraform_init already ran."""
+    tf = _TOOLS.get("terraform")
+    if not tf:
+        return {"ok": False, "stderr": "terraform not found"}
+    if not skip_init:
+        failed = await terraform_init(repo)
+        if failed: return failed
+    plan = await _run([tf, "plan", "-no-color", "-out", "tf.plan"], cwd=repo,
+                      stdout_path=repo / ".terraform" / "ig-plan.log")
+    if not plan.get("ok"): return _debug_info(plan)
+    show = await _run_stream([tf, "show", "-json", "tf.plan"], cwd=repo, parse=_parse_tf_plan)
+    return {"ok": show.get("ok", False), "json": show.pop("json"), "raw": _debug_info(show)}
+
+async def tfsec_scan(repo: Path) -> CmdResult:
+    tfsec = _TOOLS.get("tfsec")
+    if not tfsec:
         return {"ok": False, "stderr": "tfsec not found"}
-    res = _run(["tfsec", "--format", "json", "--no-color", "."], cwd=repo)
-    return {"ok": res.get("ok", False), "json": _safe_json(res.get("stdout", "")), "raw": res}
+    async with _scan_sem():
+        res = await _run_stream([tfsec, "--format", "json", "--no-color", "."], cwd=repo, parse=_parse_tfsec)
+    return {"ok": res.get("ok", False), "json": res.pop("json"), "raw": _debug_info(res)}
 
-def checkov_scan(repo: Path) -> CmdResult:
-    if not _which("checkov"):
+async def checkov_scan(repo: Path) -> CmdResult:
+    checkov = _TOOLS.get("checkov")
+    if not checkov:
         return {"ok": False, "stderr": "checkov not found"}
-    res = _run(["checkov", "-d", ".", "-o", "json"], cwd=repo)
-    return {"ok": res.get("ok", False), "json": _safe_json(res.get("stdout", "")), "raw": res}
+    async with _scan_sem():
+        res = await _run_stream([checkov, "-d", ".", "-o", "json"], cwd=repo, parse=_parse_checkov)
+    return {"ok": res.get("ok", False), "json": res.pop("json"), "raw": _debug_info(res)}
 
-def infracost_breakdown(repo: Path) -> CmdResult:
-    if not _which("infracost"):
+async def infracost_breakdown(repo: Path) -> CmdResult:
+    infracost = _TOOLS.get("infracost")
+    if not infracost:
         return {"ok": False, "stderr": "infracost not found"}
-    res = _run(["infracost", "breakdown", "--path", ".", "--format", "json"], cwd=repo)
-    return {"ok": res.get("ok", False), "json": _safe_json(res.get("stdout", "")), "raw": res}
+    async with _scan_sem():
+        res = await _run_stream([infracost, "breakdown", "--path", ".", "--format", "json"],
+                                cwd=repo, parse=_parse_infracost)
+    return {"ok": res.get("ok", False), "json": res.pop("json"), "raw": _debug_info(res)}
+
+def _summarize(findings: List[Dict[str, Any]], id_key: str, n: int = 5):
+    """
+    One pass over `findings`: severity counts (folded onto _SEVERITIES) plus the
+    first `n` unique (id_key, resource) findings. The same rule often fires
+    repeatedly on one resource, so only its first hit makes the top list.
+    """
+    counts = dict.fromkeys(_SEVERITIES, 0)
+    seen, top = set(), []
+    for f in findings:
+        sev = (f.get("severity") or f.get("severity_label") or "UNKNOWN").upper()
+        if sev not in counts: sev = "UNKNOWN"
+        counts[sev] += 1
+        if len(top) < n:
+            k = (f.get(id_key), f.get("resource"))
+            if k not in seen:
+                seen.add(k)
+                top.append(f)
+    return counts, top
 
 def aggregate(results: Dict[str, CmdResult]) -> Dict[str, Any]:
     agg: Dict[str, Any] = {"warnings": []}
@@ -89,30 +311,18 @@ def aggregate(results: Dict[str, CmdResult]) -> Dict[str, Any]:
     elif infr.get("stderr"):
         agg["warnings"].append(f"infracost: {infr['stderr']}")
 
-    def sev_count(findings, sev_key: str = "severity"):
-        counts = {"CRITICAL":0,"HIGH":0,"MEDIUM":0,"LOW":0,"UNKNOWN":0}
-        for f in findings:
-            sev = (f.get(sev_key) or f.get("severity_label") or "UNKNOWN").upper()
-            if sev not in counts: sev = "UNKNOWN"
-            counts[sev] += 1
-        return counts
-
-    agg["tfsec"] = {"count": len(tfsec_findings), "severities": sev_count(tfsec_findings)}
-    agg["checkov"] = {"count": len(checkov_findings), "severities": sev_count(checkov_findings)}
+    tfsec_counts, top_tfsec = _summarize(tfsec_findings, "rule_id")
+    checkov_counts, top_checkov = _summarize(checkov_findings, "check_id")
+    agg["tfsec"] = {"count": len(tfsec_findings), "severities": tfsec_counts}
+    agg["checkov"] = {"count": len(checkov_findings), "severities": checkov_counts}
     agg["infracost"] = {"monthly_cost": total_monthly}
 
     agg["top_tfsec"] = [
         {"rule": f.get("rule_id"), "severity": f.get("severity"), "resource": f.get("resource")}
-        for f in tfsec_findings[:5]
+        for f in top_tfsec
     ]
     agg["top_checkov"] = [
         {"check_id": f.get("check_id"), "severity": f.get("severity"), "resource": f.get("resource")}
-        for f in checkov_findings[:5]
+        for f in top_checkov
     ]
     return agg
-
-def _safe_json(s: str):
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
\ No newline at end of file
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import json, os, tempfile, threading, time
+from pathlib import Path
+from typing import Dict, Optional
+
+# Optional deps: sentence-transformers + faiss-cpu. Without them the cache is disabled.
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except Exception:  # pragma: no cover - optional dependency
+    faiss = None
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_THRESHOLD = 0.95
+
+
+def _atomic_write(path: Path, write) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of synthesized reports.
+
+    Entries are partitioned by an exact key (severity counts, cost bucket, warnings,
+    tool status, model, prompt), so only reports for identical rollups are ever candidates. Within a
+    partition, the top-issue text is embedded with a sentence-transformer and searched
+    by cosine similarity (IndexFlatIP over normalized vectors). Entries older than
+    `ttl` seconds are ignored.
+    """
+
+    def __init__(self, root: Path, model_name: str = DEFAULT_MODEL,
+                 threshold: float = DEFAULT_THRESHOLD, ttl: float = 7 * 24 * 3600):
+        self.root = root / "sem"
+        self.threshold = threshold
+        self.ttl = ttl
+        self._model = SentenceTransformer(model_name)
+        self._dim = self._model.get_sentence_embedding_dimension()
+        self._lock = threading.Lock()
+        self._parts: Dict[str, tuple] = {}  # partition -> (index, [{"value", "ts"}])
+
+    def _embed(self, text: str):
+        vec = self._model.encode([text], normalize_embeddings=True)
+        return np.asarray(vec, dtype="float32")
+
+    def _load(self, partition: str):
+        if partition in self._parts:
+            return self._parts[partition]
+        index_path = self.root / f"{partition}.faiss"
+        values_path = self.root / f"{partition}.json"
+        index, values = faiss.IndexFlatIP(self._dim), []
+        try:
+            if index_path.exists() and values_path.exists():
+                index = faiss.read_index(str(index_path))
+                values = json.loads(values_path.read_text(encoding="utf-8"))
+                n = min(index.ntotal, len(values))
+                if index.ntotal != n:  # interrupted write: drop the unmatched tail
+                    rebuilt = faiss.IndexFlatIP(self._dim)
+                    if n:
+                        rebuilt.add(index.reconstruct_n(0, n))
+                    index = rebuilt
+                values = values[:n]
+        except Exception:
+            index, values = faiss.IndexFlatIP(self._dim), []
+        self._parts[partition] = (index, values)
+        return index, values
+
+    def lookup(self, partition: str, text: str) -> Optional[str]:
+        with self._lock:
+            index, values = self._load(partition)
+            if index.ntotal == 0:
+                return None
+            k = min(index.ntotal, 5)
+            scores, ids = index.search(self._embed(text), k)
+            now = time.time()
+            for score, i in zip(scores[0], ids[0]):
+                if i < 0 or i >= len(values) or score < self.threshold:
+                    continue
+                if now - values[i]["ts"] < self.ttl:
+                    return values[i]["value"]
+            return None
+
+    def add(self, partition: str, text: str, value: str) -> None:
+        with self._lock:
+            index, values = self._load(partition)
+            index.add(self._embed(text))
+            values.append({"value": value, "ts": time.time()})
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                # index first: on a crash in between, _load trims the index to the values
+                _atomic_write(self.root / f"{partition}.faiss",
+                              lambda tmp: faiss.write_index(index, tmp))
+                _atomic_write(self.root / f"{partition}.json",
+                              lambda tmp: Path(tmp).write_text(json.dumps(values), encoding="utf-8"))
+            except OSError:
+                pass
+
+
+_CACHE: Optional[SemanticCache] = None
+
+def get_semantic_cache(root: Path) -> Optional[SemanticCache]:
+    """Process-wide cache instance when INFRAGUARDIAN_SEMANTIC_CACHE=1 and deps are installed, else None."""
+    global _CACHE
+    if faiss is None or os.getenv("INFRAGUARDIAN_SEMANTIC_CACHE", "0") != "1":
+        return None
+    if _CACHE is None:
+        try:
+            threshold = float(os.getenv("INFRAGUARDIAN_SEMANTIC_THRESHOLD", DEFAULT_THRESHOLD))
+            ttl = float(os.getenv("INFRAGUARDIAN_CACHE_TTL") or 7 * 24 * 3600)
+            _CACHE = SemanticCache(root, threshold=threshold, ttl=ttl)
+        except Exception:
+            return None
+    return _CACHE
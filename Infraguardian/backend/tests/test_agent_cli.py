@@ -0,0 +1,42 @@
+import subprocess
+
+from app.agent_cli import _changed_modules, _checkpoint_serde
+from app.models import AgentState, PlanStep, RepoContext, ReviewPlan
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", "-c", "user.email=t@t", "-c", "user.name=t", *args],
+                   cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def test_changed_modules_in_subdirectory(tmp_path, monkeypatch):
+    infra = tmp_path / "infra"
+    infra.mkdir()
+    (infra / "main.tf").write_text("# v1\n")
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-qm", "init")
+    _git(tmp_path, "branch", "base")
+
+    (infra / "main.tf").write_text("# v2\n")   # modified, tracked
+    (infra / "new.tf").write_text("# new\n")   # untracked, same module
+    monkeypatch.setenv("INFRAGUARDIAN_BASE_REF", "base")
+
+    assert _changed_modules(str(infra)) == 1
+
+
+def test_changed_modules_unknown_base(tmp_path, monkeypatch):
+    (tmp_path / "main.tf").write_text("# v1\n")
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-qm", "init")
+    monkeypatch.setenv("INFRAGUARDIAN_BASE_REF", "no-such-ref")
+
+    assert _changed_modules(str(tmp_path)) is None
+
+
+def test_checkpoint_serde_round_trips_state_models():
+    state = AgentState(ctx=RepoContext(repo_dir="."), plan=ReviewPlan(
+        steps=[PlanStep(tool="tfsec")], justification="j"))
+    serde = _checkpoint_serde()
+    assert serde.loads_typed(serde.dumps_typed(state)) == state
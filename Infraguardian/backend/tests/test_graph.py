@@ -0,0 +1,72 @@
+from app import graph
+from app.graph import _default_plan, _llm_cache_get
+from app.models import AgentState, Findings, RepoContext
+
+
+def _tools(plan):
+    return [s.tool for s in plan.steps]
+
+
+def test_default_plan_small_diff_skips_checkov():
+    plan = _default_plan(RepoContext(repo_dir=".", changed_modules=1), "test")
+    assert "checkov" not in _tools(plan)
+    assert "tfsec" in _tools(plan)
+
+
+def test_default_plan_bad_threshold_falls_back(monkeypatch):
+    monkeypatch.setenv("INFRAGUARDIAN_FAST_PATH_MODULES", "x")
+    assert "checkov" not in _tools(_default_plan(RepoContext(repo_dir=".", changed_modules=2), "test"))
+    assert "checkov" in _tools(_default_plan(RepoContext(repo_dir=".", changed_modules=3), "test"))
+
+
+def test_llm_cache_bad_ttl_is_not_fatal(tmp_path, monkeypatch):
+    monkeypatch.setenv("INFRAGUARDIAN_CACHE_TTL", "abc")
+    path = tmp_path / "entry.json"
+    assert _llm_cache_get(path) is None
+    path.write_bytes(b'{"content": "cached"}')
+    assert _llm_cache_get(path) == "cached"
+
+
+class _FakeLLM:
+    model_name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return type("Msg", (), {"content": f"report {self.calls}"})()
+
+
+class _SpyCache:
+    def __init__(self):
+        self.lookups, self.adds = [], []
+
+    def lookup(self, partition, text):
+        self.lookups.append((partition, text))
+        return None
+
+    def add(self, partition, text, value):
+        self.adds.append((partition, text, value))
+
+
+def _synth(monkeypatch, tmp_path, findings):
+    spy = _SpyCache()
+    monkeypatch.setenv("INFRAGUARDIAN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(graph, "_llm", lambda: _FakeLLM())
+    monkeypatch.setattr(graph, "get_semantic_cache", lambda root: spy)
+    graph.synth_node(AgentState(ctx=RepoContext(repo_dir="."), findings=Findings(**findings)))
+    return spy
+
+
+def test_semantic_cache_skipped_without_top_issues(monkeypatch, tmp_path):
+    spy = _synth(monkeypatch, tmp_path, {"warnings": ["checkov: checkov not found"]})
+    assert spy.lookups == [] and spy.adds == []
+
+
+def test_semantic_partition_includes_warnings(monkeypatch, tmp_path):
+    top = {"count": 1, "parsed": True, "top": [{"rule": "r1", "severity": "HIGH", "resource": "a"}]}
+    a = _synth(monkeypatch, tmp_path / "a", {"tfsec": top, "warnings": ["checkov: checkov not found"]})
+    b = _synth(monkeypatch, tmp_path / "b", {"tfsec": top, "warnings": ["terraform: init failed"]})
+    assert a.lookups[0][1] == b.lookups[0][1]
+    assert a.lookups[0][0] != b.lookups[0][0]
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+from app.runner import _parse_checkov, _parse_infracost, aggregate
+
+
+def _parse(parser, payload):
+    """Feed `payload` as JSON bytes through an asyncio.StreamReader into `parser`."""
+    async def run():
+        stream = asyncio.StreamReader()
+        data = json.dumps(payload).encode()
+        for i in range(0, len(data), 7):  # small chunks to exercise incremental parsing
+            stream.feed_data(data[i:i + 7])
+        stream.feed_eof()
+        return await parser(stream)
+    return asyncio.run(run())
+
+
+def _check(check_id, severity, resource):
+    return {"check_id": check_id, "severity": severity, "resource": resource,
+            "code_block": [[1, "resource {}"]], "guideline": "https://example.invalid"}
+
+
+def test_parse_checkov_single_framework_dict():
+    out = _parse(_parse_checkov, {
+        "check_type": "terraform",
+        "results": {"passed_checks": [_check("CKV_P", "LOW", "ok")],
+                    "failed_checks": [_check("CKV_AWS_18", "HIGH", "aws_s3_bucket.data")]},
+    })
+    failed = out["results"]["failed_checks"]
+    assert [f["check_id"] for f in failed] == ["CKV_AWS_18"]
+    assert "code_block" not in failed[0]
+
+
+def test_parse_checkov_multi_framework_list():
+    out = _parse(_parse_checkov, [
+        {"check_type": "terraform",
+         "results": {"failed_checks": [_check("CKV_1", "HIGH", "a"), _check("CKV_2", None, "b")]}},
+        {"check_type": "secrets", "results": {"failed_checks": [_check("CKV_SECRET_2", "LOW", "c")]}},
+    ])
+    agg = aggregate({"checkov": {"json": out}})
+    assert agg["checkov"]["count"] == 3
+    assert agg["checkov"]["severities"]["HIGH"] == 1
+    assert agg["checkov"]["severities"]["UNKNOWN"] == 1
+
+
+def test_parse_infracost_sums_projects():
+    out = _parse(_parse_infracost, {"projects": [
+        {"summary": {"totalMonthlyCost": "12.50"}},
+        {"summary": {"totalMonthlyCost": None}},
+        {"summary": {"totalMonthlyCost": "7.5"}},
+    ]})
+    assert aggregate({"infracost": {"json": out}})["infracost"]["monthly_cost"] == 20.0